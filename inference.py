@@ -20,8 +20,14 @@ import json
 import time
 import logging
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
 # Set up file logging to capture complete output (Node.js truncates stdout)
 LOG_FILE = '/tmp/inference.log'
 logging.basicConfig(level=logging.INFO,
@@ -462,8 +468,29 @@ def generate_annotated_video(video_metadata: Dict[str, Any],
 # ============================================================================
 
 
+def load_gemini_module():
+    """
+    Import tennis_analysis/gemini_match_analysis.py (and the google-genai SDK
+    it pulls in), which takes long enough to be worth doing in the background.
+    """
+    import importlib.util
+    gemini_path = os.path.join(os.path.dirname(__file__), 'tennis_analysis',
+                               'gemini_match_analysis.py')
+    spec = importlib.util.spec_from_file_location("gemini_analysis",
+                                                  gemini_path)
+    if spec is None or spec.loader is None:
+        raise ImportError(
+            f"Could not load gemini_match_analysis from {gemini_path}")
+    gemini_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gemini_module)
+    return gemini_module
+
+
 def call_gemini_llm(biomechanics: Dict[str, Any],
-                    annotated_video_path: str = None) -> Dict[str, Any]:
+                    annotated_video_path: str = None,
+                    gemini_module_future: Optional[Future] = None,
+                    jpeg_frames: Optional[List[bytes]] = None
+                    ) -> Dict[str, Any]:
     """
     Call Gemini LLM to generate professional coaching insights.
 
@@ -472,6 +499,10 @@ def call_gemini_llm(biomechanics: Dict[str, Any],
     Args:
         biomechanics: Dictionary of analyzed biomechanical metrics
         annotated_video_path: Path to the annotated video file
+        gemini_module_future: Pending load_gemini_module() call started
+            earlier; the module is loaded here if not given
+        jpeg_frames: Sampled annotated frames, JPEG-encoded during
+            annotation; the video is re-read if not given
 
     Returns:
         Structured analysis with strengths, fixes, and practice plan
@@ -485,23 +516,16 @@ def call_gemini_llm(biomechanics: Dict[str, Any],
     if api_key and annotated_video_path:
         try:
             # Import and call gemini_match_analysis
-            import importlib.util
-            gemini_path = os.path.join(os.path.dirname(__file__),
-                                       'tennis_analysis',
-                                       'gemini_match_analysis.py')
-            spec = importlib.util.spec_from_file_location(
-                "gemini_analysis", gemini_path)
-            if spec is None or spec.loader is None:
-                raise ImportError(
-                    f"Could not load gemini_match_analysis from {gemini_path}")
-            gemini_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(gemini_module)
+            if gemini_module_future is not None:
+                gemini_module = gemini_module_future.result()
+            else:
+                gemini_module = load_gemini_module()
 
             print(
                 f"[STEP 3.2] Running Gemini match analysis on: {annotated_video_path}"
             )
             gemini_result = gemini_module.analyze_match(
-                api_key, annotated_video_path)
+                api_key, annotated_video_path, jpeg_frames=jpeg_frames)
 
             # Log the analysis results
             print(f"\n{'='*60}")
@@ -659,6 +683,28 @@ def format_output(video_metadata: Dict[str, Any], biomechanics: Dict[str, Any],
     return output
 
 
+def _json_default(obj):
+    """Convert NumPy values for the stdlib json fallback."""
+    # NumPy arrays and scalars both provide tolist()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_json(data: Any, indent: bool = False) -> str:
+    """
+    Serialize output for the backend, using orjson when it is installed.
+
+    Both paths accept NumPy arrays and scalars directly.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option).decode()
+    return json.dumps(data, indent=2 if indent else None, default=_json_default)
+
+
 # ============================================================================
 # MAIN EXECUTION
 # ============================================================================
@@ -675,7 +721,7 @@ def main():
     # Parse command line arguments
     if len(sys.argv) < 2:
         print(
-            json.dumps({
+            dumps_json({
                 "status":
                 "error",
                 "message":
@@ -695,6 +741,28 @@ def main():
     print(f"Output directory: {output_dir}")
     print("=" * 60)
 
+    # The Gemini SDK import only depends on the API key being set, so
+    # start it now and let it overlap with the tennis analysis below
+    loader = ThreadPoolExecutor(max_workers=1)
+    gemini_module_future = None
+    frame_callback = None
+    gemini_frames: Dict[int, bytes] = {}
+    if os.environ.get("GEMINI_API_KEY"):
+        gemini_module_future = loader.submit(load_gemini_module)
+
+        import cv2
+
+        # Encode the frames Gemini samples while annotation has them in
+        # memory, instead of decoding the annotated video again afterwards.
+        # The sampling stride is the Gemini module's own FRAME_STRIDE; the
+        # module has finished loading long before annotation starts.
+        def frame_callback(frame_idx: int, frame: Any) -> None:
+            if gemini_module_future.exception() is not None:
+                return
+            if frame_idx % gemini_module_future.result().FRAME_STRIDE == 0:
+                gemini_frames[frame_idx] = cv2.imencode(".jpg",
+                                                        frame)[1].tobytes()
+
     try:
         # Import and run the tennis analysis main function
         import importlib.util
@@ -711,7 +779,8 @@ def main():
         # Run the full tennis analysis pipeline
         annotated_path = os.path.join(output_dir, "annotated_output.mp4")
         analysis_results = tennis_utils.main(input_video=video_path,
-                                             output_video=annotated_path)
+                                             output_video=annotated_path,
+                                             frame_callback=frame_callback)
         print("before generated the annotated output video!")
 
         # Extract data from analysis results
@@ -727,7 +796,9 @@ def main():
         annotated_video = analysis_results["annotated_video_path"]
         print("generated the annotated output video!")
         # Call Gemini LLM for coaching insights
-        gemini_analysis = call_gemini_llm(biomechanics, annotated_video)
+        gemini_analysis = call_gemini_llm(
+            biomechanics, annotated_video, gemini_module_future,
+            [gemini_frames[idx] for idx in sorted(gemini_frames)] or None)
 
         # Format and output results
         results = format_output(video_metadata, biomechanics, gemini_analysis,
@@ -736,7 +807,7 @@ def main():
         # Print the final JSON output for the backend to parse
         print("\n" + "=" * 60)
         print("INFERENCE_RESULT_JSON_START")
-        print(json.dumps(results, indent=2))
+        print(dumps_json(results, indent=True))
         print("INFERENCE_RESULT_JSON_END")
         print("=" * 60)
         print("\nsuccess.done")
@@ -753,10 +824,13 @@ def main():
             "video_path": video_path,
             "traceback": error_traceback
         }
-        print(json.dumps(error_output))
+        print(dumps_json(error_output))
         print("\nerror.failed")
         sys.exit(1)
 
+    finally:
+        loader.shutdown(wait=False)
+
 
 if __name__ == "__main__":
     main()
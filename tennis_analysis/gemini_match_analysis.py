@@ -6,6 +6,8 @@ import re
 from google import genai  # type: ignore
 from google.genai import types  # type: ignore
 
+from utils import iter_sampled_frames
+
 # ===================k=========
 # ARGUMENTS
 # ============================
@@ -70,22 +72,12 @@ Analyze the match and output STRICT JSON:
 # FRAME EXTRACTION
 # ============================
 def extract_frames(video_path, stride):
-    cap = cv2.VideoCapture(video_path)
+    # Hardware-accelerated decode where available; only sampled frames are
+    # converted to BGR
     frames = []
-    idx = 0
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        if idx % stride == 0:
-            _, buffer = cv2.imencode(".jpg", frame)
-            frames.append(base64.b64encode(buffer).decode("utf-8"))
-
-        idx += 1
-
-    cap.release()
+    for _, frame in iter_sampled_frames(video_path, stride):
+        _, buffer = cv2.imencode(".jpg", frame)
+        frames.append(base64.b64encode(buffer).decode("utf-8"))
     return frames
 
 # ============================
@@ -148,13 +140,14 @@ def format_summary(raw_text):
 # ============================
 # GEMINI CALL
 # ============================
-def analyze_match(api_key, video_path=None):
+def analyze_match(api_key, video_path=None, jpeg_frames=None):
     """
     Analyze a tennis match video using Gemini.
     
     Args:
         api_key: Google AI Studio API key
         video_path: Path to the annotated video file (optional, uses default if not provided)
+        jpeg_frames: Already-sampled JPEG frames; skips re-reading the video
     
     Returns:
         Dictionary with analysis results
@@ -167,16 +160,17 @@ def analyze_match(api_key, video_path=None):
         http_options={"api_version": "v1alpha"}
     )
 
-    frames_b64 = extract_frames(video_to_analyze, FRAME_STRIDE)
+    if jpeg_frames is None:
+        jpeg_frames = [base64.b64decode(f) for f in extract_frames(video_to_analyze, FRAME_STRIDE)]
 
     parts = [types.Part(text=PROMPT_TEXT)]
 
-    for f in frames_b64:
+    for f in jpeg_frames:
         parts.append(
             types.Part(
                 inline_data=types.Blob(
                     mime_type="image/jpeg",
-                    data=base64.b64decode(f),
+                    data=f,
                 ),
                 media_resolution={"level": "media_resolution_high"}
             )
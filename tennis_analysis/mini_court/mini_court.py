@@ -12,8 +12,7 @@ from utils import (
    get_closest_keypoint_index,
    get_height_of_bbox,
    measure_xy_distance,
-   get_center_of_bbox,
-   measure_distance
+   get_center_of_bbox
 )
 
 class MiniCourt():
@@ -229,6 +228,21 @@ class MiniCourt():
            player_heights = {1: constants.PLAYER_1_HEIGHT_METERS, 2: constants.PLAYER_2_HEIGHT_METERS}
 
 
+       # Player height in pixels is the tallest box from 20 frames before to
+       # 50 frames after each frame. Computed for every frame at once as a
+       # sliding max over per-player height arrays (-inf where the player
+       # isn't detected), instead of rescanning the window per frame.
+       window_before, window_after = 20, 50
+       num_frames = len(player_boxes)
+       max_player_heights = {}
+       for player_id in {pid for frame_bbox in player_boxes for pid in frame_bbox}:
+           heights = np.full(num_frames + window_before + window_after - 1, -np.inf)
+           for i, frame_bbox in enumerate(player_boxes):
+               if player_id in frame_bbox:
+                   heights[window_before + i] = get_height_of_bbox(frame_bbox[player_id])
+           max_player_heights[player_id] = np.lib.stride_tricks.sliding_window_view(
+               heights, window_before + window_after).max(axis=1).tolist()
+
        output_player_boxes= []
        output_ball_boxes= []
 
@@ -236,8 +250,18 @@ class MiniCourt():
        for frame_num, player_bbox in enumerate(player_boxes):
            ball_box = ball_boxes[frame_num][1]
            ball_position = get_center_of_bbox(ball_box)
-           closest_player_id_to_ball = min(player_bbox.keys(), key=lambda x: measure_distance(ball_position, get_center_of_bbox(player_bbox[x])))
+           # Nearest player to the ball; squared distances compare the same
+           closest_player_id_to_ball = None
+           closest_distance = float('inf')
+           for player_id, bbox in player_bbox.items():
+               center_x, center_y = get_center_of_bbox(bbox)
+               distance = (center_x - ball_position[0])**2 + (center_y - ball_position[1])**2
+               if distance < closest_distance:
+                   closest_player_id_to_ball = player_id
+                   closest_distance = distance
 
+           # One ball entry per frame; left empty when no player is detected
+           output_ball_dict = {}
 
            output_player_bboxes_dict = {}
            for player_id, bbox in player_bbox.items():
@@ -256,10 +280,7 @@ class MiniCourt():
 
 
                # Get Player height in pixels
-               frame_index_min = max(0, frame_num-20)
-               frame_index_max = min(len(player_boxes), frame_num+50)
-               bboxes_heights_in_pixels = [get_height_of_bbox(player_boxes[i][player_id]) for i in range (frame_index_min,frame_index_max)]
-               max_player_height_in_pixels = max(bboxes_heights_in_pixels)
+               max_player_height_in_pixels = max_player_heights[player_id][frame_num]
 
 
                mini_court_player_position = self.get_mini_court_coordinates(foot_position,
@@ -284,8 +305,9 @@ class MiniCourt():
                                                                            max_player_height_in_pixels,
                                                                            player_heights[player_id]
                                                                            )
-                   output_ball_boxes.append({1:mini_court_player_position})
+                   output_ball_dict[1] = mini_court_player_position
            output_player_boxes.append(output_player_bboxes_dict)
+           output_ball_boxes.append(output_ball_dict)
 
 
        return output_player_boxes , output_ball_boxes
@@ -330,6 +352,16 @@ class MiniCourt():
     x, y = point
     return (self.court_start_x <= x <= self.court_end_x and 
             self.court_start_y <= y <= self.court_end_y)
+
+   def are_points_inside_court(self, points):
+    """
+    Vectorized is_point_inside_court for an (N, 2) array of mini-court points.
+    Returns:
+        (N,) bool array
+    """
+    x, y = points[:, 0], points[:, 1]
+    return ((self.court_start_x <= x) & (x <= self.court_end_x) &
+            (self.court_start_y <= y) & (y <= self.court_end_y))
    
    def draw_circle_on_mini_court(
         self,
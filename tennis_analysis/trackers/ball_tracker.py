@@ -1,26 +1,39 @@
 from ultralytics import YOLO 
 import cv2
+import torch
 import pickle
 import pandas as pd
 
 class BallTracker:
-    def __init__(self,model_path):
+    def __init__(self,model_path, batch_size=16, device=None, imgsz=640):
         self.model = YOLO(model_path)
+        # Exported engines are already optimized and can't be fused
+        if not str(model_path).endswith('.engine'):
+            self.model.fuse()
+        self.batch_size = batch_size
+        # YOLO letterboxes every frame down to this size itself, so full-res
+        # frames go in and boxes come back in frame coordinates
+        self.imgsz = imgsz
+        # FP16 on GPU; CPU inference stays FP32
+        if device is None:
+            device = 0 if torch.cuda.is_available() else 'cpu'
+        self.device = device
+        self.half = torch.cuda.is_available()
 
     def interpolate_ball_positions(self, ball_positions):
         ball_positions = [x.get(1,[]) for x in ball_positions]
         # convert the list into pandas dataframe
         df_ball_positions = pd.DataFrame(ball_positions,columns=['x1','y1','x2','y2'])
 
-        # interpolate the missing values
-        df_ball_positions = df_ball_positions.interpolate()
-        df_ball_positions = df_ball_positions.bfill()
+        # interpolate the missing values; both directions also fills any
+        # leading/trailing gap from the nearest detection
+        df_ball_positions = df_ball_positions.interpolate(limit_direction='both')
 
         ball_positions = [{1:x} for x in df_ball_positions.to_numpy().tolist()]
 
         return ball_positions
 
-    def get_ball_shot_frames(self,ball_positions):
+    def get_ball_shot_frames(self,ball_positions, minimum_change_frames_for_hit=25):
         ball_positions = [x.get(1,[]) for x in ball_positions]
         # convert the list into pandas dataframe
         df_ball_positions = pd.DataFrame(ball_positions,columns=['x1','y1','x2','y2'])
@@ -30,7 +43,6 @@ class BallTracker:
         df_ball_positions['mid_y'] = (df_ball_positions['y1'] + df_ball_positions['y2'])/2
         df_ball_positions['mid_y_rolling_mean'] = df_ball_positions['mid_y'].rolling(window=5, min_periods=1, center=False).mean()
         df_ball_positions['delta_y'] = df_ball_positions['mid_y_rolling_mean'].diff()
-        minimum_change_frames_for_hit = 25
         for i in range(1,len(df_ball_positions)- int(minimum_change_frames_for_hit*1.2) ):
             negative_position_change = df_ball_positions['delta_y'].iloc[i] >0 and df_ball_positions['delta_y'].iloc[i+1] <0
             positive_position_change = df_ball_positions['delta_y'].iloc[i] <0 and df_ball_positions['delta_y'].iloc[i+1] >0
@@ -62,11 +74,9 @@ class BallTracker:
             return ball_detections
 
         total_frames = len(frames)
-        for i, frame in enumerate(frames):
-            if i % 20 == 0:  # Log progress every 20 frames
-                print(f"  [BallTracker] Processing frame {i+1}/{total_frames}...")
-            ball_dict = self.detect_frame(frame)
-            ball_detections.append(ball_dict)
+        for i in range(0, total_frames, self.batch_size):
+            print(f"  [BallTracker] Processing frame {i+1}/{total_frames}...")
+            ball_detections.extend(self.detect_batch(frames[i:i+self.batch_size]))
         
         if stub_path is not None:
             with open(stub_path, 'wb') as f:
@@ -74,9 +84,30 @@ class BallTracker:
         
         return ball_detections
 
+    def detect_batch(self, frames):
+        # Runs in chunks of self.batch_size, halving it for the rest of the
+        # run if a chunk doesn't fit in GPU memory
+        detections = []
+        start = 0
+        while start < len(frames):
+            chunk = frames[start:start+self.batch_size]
+            try:
+                results = self.model.predict(chunk, conf=0.15, device=self.device, imgsz=self.imgsz, half=self.half, verbose=False)
+            except torch.cuda.OutOfMemoryError:
+                if self.batch_size == 1:
+                    raise
+                torch.cuda.empty_cache()
+                self.batch_size //= 2
+                print(f"  [BallTracker] Out of GPU memory, batch size reduced to {self.batch_size}")
+                continue
+            detections.extend(self.parse_results(result) for result in results)
+            start += len(chunk)
+        return detections
+
     def detect_frame(self,frame):
-        results = self.model.predict(frame,conf=0.15)[0]
+        return self.parse_results(self.model.predict(frame,conf=0.15, device=self.device, imgsz=self.imgsz, half=self.half)[0])
 
+    def parse_results(self, results):
         ball_dict = {}
         for box in results.boxes:
             result = box.xyxy.tolist()[0]
@@ -1,5 +1,6 @@
 from ultralytics import YOLO 
 import cv2
+import torch
 import pickle
 import sys
 import os
@@ -8,8 +9,20 @@ sys.path.append('../')
 from utils import measure_distance, get_center_of_bbox
 
 class PlayerTracker:
-    def __init__(self,model_path):
+    def __init__(self,model_path, batch_size=16, device=None, imgsz=640):
         self.model = YOLO(model_path)
+        # Exported engines are already optimized and can't be fused
+        if not str(model_path).endswith('.engine'):
+            self.model.fuse()
+        self.batch_size = batch_size
+        # YOLO letterboxes every frame down to this size itself, so full-res
+        # frames go in and boxes come back in frame coordinates
+        self.imgsz = imgsz
+        # FP16 on GPU; CPU inference stays FP32
+        if device is None:
+            device = 0 if torch.cuda.is_available() else 'cpu'
+        self.device = device
+        self.half = torch.cuda.is_available()
 
     def choose_and_filter_players(self, court_keypoints, player_detections):
         player_detections_first_frame = player_detections[0]
@@ -48,12 +61,12 @@ class PlayerTracker:
                 player_detections = pickle.load(f)
             return player_detections
 
+        # One model call per batch; the tracker still steps through the
+        # batch's frames in order, so track ids stay consistent
         total_frames = len(frames)
-        for i, frame in enumerate(frames):
-            if i % 20 == 0:  # Log progress every 20 frames
-                print(f"  [PlayerTracker] Processing frame {i+1}/{total_frames}...")
-            player_dict = self.detect_frame(frame)
-            player_detections.append(player_dict)
+        for i in range(0, total_frames, self.batch_size):
+            print(f"  [PlayerTracker] Processing frame {i+1}/{total_frames}...")
+            player_detections.extend(self.detect_batch(frames[i:i+self.batch_size]))
         
         if stub_path is not None:
             with open(stub_path, 'wb') as f:
@@ -61,8 +74,30 @@ class PlayerTracker:
         
         return player_detections
 
+    def detect_batch(self, frames):
+        # Runs in chunks of self.batch_size, halving it for the rest of the
+        # run if a chunk doesn't fit in GPU memory
+        detections = []
+        start = 0
+        while start < len(frames):
+            chunk = frames[start:start+self.batch_size]
+            try:
+                results = self.model.track(chunk, persist=True, device=self.device, imgsz=self.imgsz, half=self.half, verbose=False)
+            except torch.cuda.OutOfMemoryError:
+                if self.batch_size == 1:
+                    raise
+                torch.cuda.empty_cache()
+                self.batch_size //= 2
+                print(f"  [PlayerTracker] Out of GPU memory, batch size reduced to {self.batch_size}")
+                continue
+            detections.extend(self.parse_results(result) for result in results)
+            start += len(chunk)
+        return detections
+
     def detect_frame(self,frame):
-        results = self.model.track(frame, persist=True)[0]
+        return self.parse_results(self.model.track(frame, persist=True, device=self.device, imgsz=self.imgsz, half=self.half)[0])
+
+    def parse_results(self, results):
         id_name_dict = results.names
 
         player_dict = {}
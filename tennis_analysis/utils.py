@@ -1,11 +1,14 @@
+import argparse
 import cv2
 import numpy as np
 import pandas as pd
-from copy import deepcopy
 import os
+import re
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from ultralytics import YOLO
 
-from utils import (read_video, save_video, measure_distance,
-                   convert_pixel_distance_to_meters)
+from utils import iter_frame_batches, process_video_threads
 import constants
 from trackers import PlayerTracker, BallTracker
 from court_line_detector import CourtLineDetector
@@ -26,143 +29,196 @@ BALL_MODEL = os.path.join(BASE_DIR, "models", "last.pt")
 COURT_MODEL = os.path.join(BASE_DIR, "models", "keypoints_model.pth")
 
 FPS = 24
+# Hits are detected from this many consecutive frames of direction change at
+# the native frame rate
+SHOT_MIN_CHANGE_FRAMES = 25
 TABLE_WIDTH = 320
+DETECT_BATCH_SIZE = 16
+# YOLO input size; TensorRT engines are exported for this size too
+DETECT_IMGSZ = 640
+# Annotation threads, leaving cores for decode and encode. Capped because
+# each worker adds two composite buffers to the ring in main().
+_AVAILABLE_CPUS = (len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity")
+                   else os.cpu_count() or 2)
+ANNOTATE_WORKERS = min(4, max(1, _AVAILABLE_CPUS - 2))
+# Composites queued for the encoder thread
+WRITE_PREFETCH = 8
+# Run YOLO through FP16 TensorRT engines on GPU, exported once and cached
+# next to the weights
+USE_TENSORRT = True
 
 
 # ======================================================
 # TABLE DRAWING
 # ======================================================
+# Static labels are rendered once into a per-height template; each frame
+# copies the template and only draws the values that change.
+TABLE_FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# (text, org, scale, color)
+BALL_TABLE_LABELS = [
+    ("NEW FEATURES", (20, 40), 0.9, (0, 0, 0)),
+    ("Player Coordinates", (20, 250), 0.7, (0, 0, 0)),
+    ("Recovery Time (s)", (20, 370), 0.7, (0, 0, 0)),
+    ("Distance Traveled (m)", (20, 490), 0.7, (0, 0, 0)),
+    ("Last Shot Speed", (20, 610), 0.7, (0, 0, 0)),
+]
+BALL_COORD_ORGS = ((20, 100), (20, 130))
+BALL_BOUNCE_ORG = (20, 190)
+PLAYER_COORD_ORGS = {1: (20, 280), 2: (20, 310)}
+RECOVERY_ORGS = {1: (20, 400), 2: (20, 430)}
+DISTANCE_ORGS = {1: (20, 520), 2: (20, 550)}
+LAST_SHOT_ORG = (20, 640)
+
+# Text colors indexed by the per-frame condition (False, True)
+BALL_COORD_COLORS = ((120, 120, 120), (0, 0, 0))
+BOUNCE_COLORS = ((0, 0, 255), (0, 150, 0))
+PLAYER_COORD_COLORS = ((120, 120, 120), (0, 0, 0))
+RECOVERY_COLORS = ((0, 0, 255), (0, 120, 0))
+LAST_SHOT_COLORS = ((140, 140, 140), (0, 120, 0))
+
+SPEED_FIELDS = [("Last Shot: ", "last_shot_speed"),
+                ("Avg Shot: ", "average_shot_speed"),
+                ("Avg Move: ", "average_player_speed")]
+SPEED_TABLE_LABELS = [("ORIGINAL FEATURES", (20, 40), 0.9, (0, 0, 0))]
+# Value anchors in SPEED_COLUMNS order
+SPEED_COLUMNS = []
+SPEED_VALUE_ORGS = []
+for _pid, _y in ((1, 100), (2, 235)):
+    SPEED_TABLE_LABELS.append((f"PLAYER {_pid}", (20, _y), 0.75, (0, 0, 0)))
+    for _row, (_label, _field) in enumerate(SPEED_FIELDS, start=1):
+        _org = (20, _y + 30 * _row)
+        SPEED_TABLE_LABELS.append((_label, _org, 0.6, (0, 0, 0)))
+        # Pen advance of the label; getTextSize alone pads for thickness
+        _label_width = (cv2.getTextSize(_label + "0", TABLE_FONT, 0.6, 2)[0][0] -
+                        cv2.getTextSize("0", TABLE_FONT, 0.6, 2)[0][0])
+        SPEED_COLUMNS.append(f"player_{_pid}_{_field}")
+        SPEED_VALUE_ORGS.append((_org[0] + _label_width, _org[1]))
+
+_table_templates = {}
+
+
+def _table_template(labels, background, height, out=None):
+    key = (id(labels), height)
+    if key not in _table_templates:
+        template = np.full((height, TABLE_WIDTH, 3), background, dtype=np.uint8)
+        for text, org, scale, color in labels:
+            cv2.putText(template, text, org, TABLE_FONT, scale, color, 2)
+        _table_templates[key] = template
+    if out is None:
+        return _table_templates[key].copy()
+    out[...] = _table_templates[key]
+    return out
+
+
 def draw_ball_table(height, ball_coords, player_coords, last_ball_speed,
-                    recovery_times, ball_in_out_status, distance_traveled):
-    table = np.full((height, TABLE_WIDTH, 3), 245, dtype=np.uint8)
-
-    y, dy = 40, 30
-
-    cv2.putText(table, "NEW FEATURES", (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.9,
-                (0, 0, 0), 2)
-    y += dy * 2
-
-    if ball_coords:
-        cv2.putText(table, f"Ball X: {ball_coords[0]}", (20, y),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.65, (0, 0, 0), 2)
-        y += dy
-        cv2.putText(table, f"Ball Y: {ball_coords[1]}", (20, y),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.65, (0, 0, 0), 2)
-        y += dy
-    else:
-        cv2.putText(table, "Ball not detected", (20, y),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.65, (120, 120, 120), 2)
-        y += dy * 2
-
-    y += dy
-    cv2.putText(table, f"Ball Bounce: {ball_in_out_status}", (20, y),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7,
-                (0, 150, 0) if ball_in_out_status == "IN" else (0, 0, 255), 2)
-    y += dy * 2
-
-    cv2.putText(table, "Player Coordinates", (20, y), cv2.FONT_HERSHEY_SIMPLEX,
-                0.7, (0, 0, 0), 2)
-    y += dy
+                    recovery_times, ball_in_out_status, distance_traveled,
+                    out=None):
+    table = _table_template(BALL_TABLE_LABELS, 245, height, out)
+
+    # Fixed set of (org, text, scale, color) rows; per-frame state only picks
+    # the text and color, never how many rows are drawn
+    lines = [
+        (BALL_COORD_ORGS[0],
+         f"Ball X: {ball_coords[0]}" if ball_coords else "Ball not detected",
+         0.65, BALL_COORD_COLORS[bool(ball_coords)]),
+        (BALL_COORD_ORGS[1],
+         f"Ball Y: {ball_coords[1]}" if ball_coords else "",
+         0.65, BALL_COORD_COLORS[True]),
+        (BALL_BOUNCE_ORG, f"Ball Bounce: {ball_in_out_status}", 0.7,
+         BOUNCE_COLORS[ball_in_out_status == "IN"]),
+    ]
 
     for pid in [1, 2]:
-        if pid in player_coords:
-            text = f"P{pid}: {player_coords[pid]}"
-            color = (0, 0, 0)
-        else:
-            text = f"P{pid}: not detected"
-            color = (120, 120, 120)
-
-        cv2.putText(table, text, (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color,
-                    2)
-        y += dy
-
-    y += dy
-    cv2.putText(table, "Recovery Time (s)", (20, y), cv2.FONT_HERSHEY_SIMPLEX,
-                0.7, (0, 0, 0), 2)
-    y += dy
+        detected = pid in player_coords
+        lines.append((PLAYER_COORD_ORGS[pid],
+                      f"P{pid}: {player_coords[pid] if detected else 'not detected'}",
+                      0.6, PLAYER_COORD_COLORS[detected]))
 
     for pid in [1, 2]:
         val = recovery_times.get(pid, 0)
-        if val == -1:
-            text, color = f"P{pid}: no recovery", (0, 0, 255)
-        else:
-            text, color = f"P{pid}: {val:.2f}s", (0, 120, 0)
+        recovered = bool(val != -1)
+        lines.append((RECOVERY_ORGS[pid],
+                      f"P{pid}: {val:.2f}s" if recovered else f"P{pid}: no recovery",
+                      0.6, RECOVERY_COLORS[recovered]))
 
-        cv2.putText(table, text, (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color,
-                    2)
-        y += dy
+    for pid in [1, 2]:
+        lines.append((DISTANCE_ORGS[pid], f"P{pid}: {distance_traveled[pid]:.2f}",
+                      0.6, (0, 0, 0)))
 
-    y += dy
-    cv2.putText(table, "Distance Traveled (m)", (20, y),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
-    y += dy
+    hit = bool(last_ball_speed > 0)
+    lines.append((LAST_SHOT_ORG, f"{last_ball_speed:.1f} km/h" if hit else "...",
+                  0.8, LAST_SHOT_COLORS[hit]))
 
-    for pid in [1, 2]:
-        cv2.putText(table, f"P{pid}: {distance_traveled[pid]:.2f}", (20, y),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-        y += dy
-
-    y += dy
-    cv2.putText(table, "Last Shot Speed", (20, y), cv2.FONT_HERSHEY_SIMPLEX,
-                0.7, (0, 0, 0), 2)
-    y += dy
-
-    if last_ball_speed > 0:
-        cv2.putText(table, f"{last_ball_speed:.1f} km/h", (20, y),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 120, 0), 2)
-    else:
-        cv2.putText(table, "...", (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
-                    (140, 140, 140), 2)
+    for org, text, scale, color in lines:
+        cv2.putText(table, text, org, TABLE_FONT, scale, color, 2)
 
     return table
 
 
-def draw_speed_table(height, stats_row):
-    table = np.full((height, TABLE_WIDTH, 3), 235, dtype=np.uint8)
+def draw_speed_table(height, speeds, out=None):
+    """speeds: one value per SPEED_COLUMNS entry, in that order."""
+    table = _table_template(SPEED_TABLE_LABELS, 235, height, out)
 
-    y = 40
-    dy = 30
+    for speed, org in zip(speeds, SPEED_VALUE_ORGS):
+        cv2.putText(table, f"{speed:.1f} km/h", org, TABLE_FONT, 0.6,
+                    (0, 0, 0), 2)
 
-    cv2.putText(table, "ORIGINAL FEATURES", (20, int(y)),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
-    y += dy * 2
+    return table
 
-    for pid in [1, 2]:
-        cv2.putText(table, f"PLAYER {pid}", (20, int(y)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 0), 2)
-        y += dy
-
-        cv2.putText(
-            table,
-            f"Last Shot: {stats_row[f'player_{pid}_last_shot_speed']:.1f} km/h",
-            (20, int(y)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-        y += dy
-
-        cv2.putText(
-            table,
-            f"Avg Shot: {stats_row[f'player_{pid}_average_shot_speed']:.1f} km/h",
-            (20, int(y)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-        y += dy
-
-        cv2.putText(
-            table,
-            f"Avg Move: {stats_row[f'player_{pid}_average_player_speed']:.1f} km/h",
-            (20, int(y)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-        y += int(dy * 1.5)
 
-    return table
+# ======================================================
+# MODEL EXPORT
+# ======================================================
+def get_engine_path(weights, batch_size, imgsz, device=0):
+    """
+    Return the cached TensorRT engine for YOLO weights, exporting it on first
+    use. Falls back to the weights without a GPU or if the export fails
+    (e.g. TensorRT is not installed).
+
+    Engines only work for the settings and GPU they were built for, so the
+    cache file is named after the batch size, input size, precision and GPU
+    model; changing any of them exports a new engine. The export runs on
+    the CUDA device the engine will be loaded on.
+    """
+    if not USE_TENSORRT or not torch.cuda.is_available():
+        return weights
+    gpu_name = re.sub(r"[^0-9A-Za-z]+", "-", torch.cuda.get_device_name(device))
+    engine_path = (f"{os.path.splitext(weights)[0]}"
+                   f"_b{batch_size}_{imgsz}_fp16_{gpu_name}.engine")
+    if os.path.exists(engine_path):
+        return engine_path
+    print(f"[TennisAnalysis] Exporting TensorRT engine for {weights}...")
+    try:
+        # Dynamic batch up to batch_size, so short last batches and the
+        # trackers' out-of-memory fallback still fit the engine
+        exported = YOLO(weights).export(format="engine", half=True,
+                                        dynamic=True, batch=batch_size,
+                                        imgsz=imgsz, device=device)
+        os.replace(exported, engine_path)
+        return engine_path
+    except Exception as e:
+        print(f"[TennisAnalysis] TensorRT export failed, using {weights}: {e}")
+        return weights
 
 
 # ======================================================
 # MAIN
 # ======================================================
-def main(input_video=None, output_video=None):
+def main(input_video=None, output_video=None, frame_callback=None,
+         frame_stride=1):
     """
     Run the tennis analysis pipeline.
     
     Args:
         input_video: Path to input video (defaults to INPUT_VIDEO constant)
         output_video: Path to save annotated output (defaults to OUTPUT_VIDEO constant)
+        frame_callback: Optional callable(frame_idx, frame) that sees each
+            annotated frame before it is written; may run on worker threads
+            and out of frame order, and must not keep the frame
+        frame_stride: Analyze and write every Nth frame only. Skipped frames
+            are still decoded but never converted, detected or drawn; the
+            output video keeps the original duration
     
     Returns:
         str: Path to the saved annotated video
@@ -173,200 +229,278 @@ def main(input_video=None, output_video=None):
     print(f"[TennisAnalysis] Input video: {input_video}")
     print(f"[TennisAnalysis] Output video: {output_video}")
 
-    video_frames = read_video(input_video)
-
-    player_tracker = PlayerTracker(model_path="yolov8x")
-    ball_tracker = BallTracker(model_path=BALL_MODEL)
-
-    player_dets = player_tracker.detect_frames(video_frames)
-    ball_dets = ball_tracker.detect_frames(video_frames)
+    # Effective frame rate of the analyzed (and written) frames
+    fps = FPS / frame_stride
+
+    # The ball model gets the second GPU when there is one; its engine is
+    # built there too
+    ball_device = 1 if torch.cuda.device_count() > 1 else 0
+    player_tracker = PlayerTracker(
+        model_path=get_engine_path("yolov8x.pt", DETECT_BATCH_SIZE,
+                                   DETECT_IMGSZ),
+        batch_size=DETECT_BATCH_SIZE,
+        imgsz=DETECT_IMGSZ)
+    ball_tracker = BallTracker(
+        model_path=get_engine_path(BALL_MODEL, DETECT_BATCH_SIZE,
+                                   DETECT_IMGSZ, device=ball_device),
+        batch_size=DETECT_BATCH_SIZE,
+        device=ball_device if torch.cuda.is_available() else None,
+        imgsz=DETECT_IMGSZ)
+
+    # Detection pass: frames are decoded on a background thread and dropped
+    # once both detectors have seen their batch, so the video is never held
+    # in memory. The first frame is kept for court and mini-court setup.
+    # The two models run concurrently on each batch (player on a worker
+    # thread, ball here); torch releases the GIL during inference.
+    player_dets = []
+    ball_dets = []
+    first_frame = None
+    with ThreadPoolExecutor(max_workers=1) as player_pool:
+        for batch in iter_frame_batches(input_video, DETECT_BATCH_SIZE,
+                                        stride=frame_stride):
+            if first_frame is None:
+                first_frame = batch[0]
+            print(f"  [TennisAnalysis] Detecting frames "
+                  f"{len(player_dets) + 1}-{len(player_dets) + len(batch)}...")
+            player_future = player_pool.submit(player_tracker.detect_batch,
+                                               batch)
+            ball_dets.extend(ball_tracker.detect_batch(batch))
+            player_dets.extend(player_future.result())
     ball_dets = ball_tracker.interpolate_ball_positions(ball_dets)
+    total_frames = len(player_dets)
 
     court_detector = CourtLineDetector(COURT_MODEL)
-    court_kps = court_detector.predict(video_frames[0])
+    court_kps = court_detector.predict(first_frame)
     player_dets = player_tracker.choose_and_filter_players(
         court_kps, player_dets)
 
-    mini_court = MiniCourt(video_frames[0])
+    mini_court = MiniCourt(first_frame)
 
     player_mc, ball_mc = mini_court.convert_bounding_boxes_to_mini_court_coordinates(
         player_dets, ball_dets, court_kps)
 
-    ball_shot_frames = ball_tracker.get_ball_shot_frames(ball_dets)
+    ball_shot_frames = ball_tracker.get_ball_shot_frames(
+        ball_dets, max(1, SHOT_MIN_CHANGE_FRAMES // frame_stride))
     baseline_centers = mini_court.get_baseline_centers()
 
-    ball_in_out_status = "IN"
-    bounce_frames = set(ball_shot_frames[1:])
+    bounce_frames = ball_shot_frames[1:]
+
+    # Mini-court scale, fixed for the whole video
+    PX_TO_M = constants.DOUBLE_LINE_WIDTH / mini_court.get_width_of_mini_court()
+    # km/h for a distance in pixels covered over a number of frames
+    PX_PER_FRAME_TO_KMH = 3.6 * PX_TO_M * fps
 
     RECOVERY_RADIUS_METERS = 1.5
-    RECOVERY_RADIUS_PX = (RECOVERY_RADIUS_METERS *
-                          mini_court.get_width_of_mini_court() /
-                          constants.DOUBLE_LINE_WIDTH)
-
-    BALL_TOUCH_RADIUS_PX = 35
-    RECOVERY_TOUCH_BUFFER = 10
-
-    recovery_times_by_frame = {}
-
-    for i in range(len(ball_shot_frames) - 1):
-        start, end = ball_shot_frames[i], ball_shot_frames[i + 1]
-
-        players = player_mc[start]
-        hitter = min(
-            players,
-            key=lambda p: measure_distance(players[p], ball_mc[start][1]))
-        opponent = 1 if hitter == 2 else 2
-
-        recovery_time = -1
-
-        for f in range(start, end):
-            if opponent not in player_mc[f]:
-                continue
-            if measure_distance(
-                    player_mc[f][opponent],
-                    baseline_centers[opponent]) <= RECOVERY_RADIUS_PX:
-                recovery_time = (f - start) / FPS
-                break
-
-        recovery_times_by_frame[start] = {opponent: recovery_time}
-
-    player_ball_touch_time = {1: None, 2: None}
-    player_circle_touch_time = {1: None, 2: None}
-
-    stats = [{
-        "frame_num": 0,
-        "player_1_number_of_shots": 0,
-        "player_1_total_shot_speed": 0,
-        "player_1_last_shot_speed": 0,
-        "player_1_total_player_speed": 0,
-        "player_1_last_player_speed": 0,
-        "player_2_number_of_shots": 0,
-        "player_2_total_shot_speed": 0,
-        "player_2_last_shot_speed": 0,
-        "player_2_total_player_speed": 0,
-        "player_2_last_player_speed": 0,
-    }]
-
-    for i in range(len(ball_shot_frames) - 1):
-        start, end = ball_shot_frames[i], ball_shot_frames[i + 1]
-        dt = (end - start) / FPS
-        if dt == 0:
-            continue
-
-        ball_dist_px = measure_distance(ball_mc[start][1], ball_mc[end][1])
-        ball_dist_m = convert_pixel_distance_to_meters(
-            ball_dist_px, constants.DOUBLE_LINE_WIDTH,
-            mini_court.get_width_of_mini_court())
-        ball_speed = (ball_dist_m / dt) * 3.6
-
-        players = player_mc[start]
-        hitter = min(
-            players,
-            key=lambda p: measure_distance(players[p], ball_mc[start][1]))
-        opponent = 1 if hitter == 2 else 2
-
-        opp_dist_px = measure_distance(player_mc[start][opponent],
-                                       player_mc[end][opponent])
-        opp_dist_m = convert_pixel_distance_to_meters(
-            opp_dist_px, constants.DOUBLE_LINE_WIDTH,
-            mini_court.get_width_of_mini_court())
-        opp_speed = (opp_dist_m / dt) * 3.6
-
-        cur = deepcopy(stats[-1])
-        cur["frame_num"] = start
-        cur[f"player_{hitter}_number_of_shots"] += 1
-        cur[f"player_{hitter}_total_shot_speed"] += ball_speed
-        cur[f"player_{hitter}_last_shot_speed"] = ball_speed
-        cur[f"player_{opponent}_total_player_speed"] += opp_speed
-        cur[f"player_{opponent}_last_player_speed"] = opp_speed
-        stats.append(cur)
-
-    df = pd.DataFrame(stats)
-    frames_df = pd.DataFrame({"frame_num": range(len(video_frames))})
-    df = pd.merge(frames_df, df, on="frame_num", how="left").ffill().fillna(0)
-
-    df["player_1_average_shot_speed"] = df["player_1_total_shot_speed"] / df[
-        "player_1_number_of_shots"].replace(0, 1)
-    df["player_2_average_shot_speed"] = df["player_2_total_shot_speed"] / df[
-        "player_2_number_of_shots"].replace(0, 1)
-    df["player_1_average_player_speed"] = df[
-        "player_1_total_player_speed"] / df[
-            "player_2_number_of_shots"].replace(0, 1)
-    df["player_2_average_player_speed"] = df[
-        "player_2_total_player_speed"] / df[
-            "player_1_number_of_shots"].replace(0, 1)
-
-    frames = player_tracker.draw_bboxes(video_frames, player_dets)
-    frames = ball_tracker.draw_bboxes(frames, ball_dets)
-    frames = court_detector.draw_keypoints_on_video(frames, court_kps)
-    frames = mini_court.draw_mini_court(frames)
-
-    frames = mini_court.draw_circle_on_mini_court(frames, baseline_centers,
-                                                  int(RECOVERY_RADIUS_PX),
-                                                  (255, 0, 0), 2)
-
-    frames = mini_court.draw_points_on_mini_court(frames, player_mc)
-    frames = mini_court.draw_points_on_mini_court(frames,
-                                                  ball_mc,
-                                                  color=(0, 255, 255))
+    RECOVERY_RADIUS_PX = RECOVERY_RADIUS_METERS / PX_TO_M
+
+    # Dense per-frame mini-court positions, NaN where not detected. The
+    # per-frame dicts from MiniCourt are unpacked once; everything after
+    # this reads the arrays.
+    # The two tracks kept by choose_and_filter_players are players 1 and 2
+    # in sorted track-ID order, as MiniCourt assigns their heights; the
+    # tracker may number them e.g. 4 and 5
+    player_ids = sorted({pid for players in player_mc for pid in players})
+    if len(player_ids) != 2:
+        raise ValueError(f"Expected 2 tracked players, got track IDs {player_ids}")
+    player_col = {pid: col for col, pid in enumerate(player_ids)}
+    mc_positions = np.full((total_frames, len(player_ids), 2), np.nan)
+    for f, players in enumerate(player_mc):
+        for pid, pos in players.items():
+            mc_positions[f, player_col[pid]] = pos
+    # Frames with no player have no ball position ({})
+    ball_arr = np.full((total_frames, 2), np.nan)
+    for f, ball in enumerate(ball_mc):
+        ball_arr[f] = ball.get(1, np.nan)
+
+    # Players 1 and 2, as used by the shot and recovery stats
+    player_arr = mc_positions
+
+    # Integer mini-court points for drawing
+    mc_points = np.nan_to_num(mc_positions).astype(np.int32)
+    mc_visible = ~np.isnan(mc_positions[..., 0])
+    ball_points = np.nan_to_num(ball_arr).astype(np.int32)
+    ball_visible = ~np.isnan(ball_arr[:, 0])
+    baseline_arr = np.array([baseline_centers[1], baseline_centers[2]],
+                            dtype=np.float64)
+
+    shot_start = np.array(ball_shot_frames[:-1], dtype=np.int64)
+    shot_end = np.array(ball_shot_frames[1:], dtype=np.int64)
+
+    # Hitter is the player closest to the ball when the shot starts
+    # (squared distance; the sqrt doesn't change the argmin)
+    hit_dist = ((player_arr[shot_start] -
+                 ball_arr[shot_start, None])**2).sum(axis=2)
+    hitter_col = np.argmin(np.where(np.isnan(hit_dist), np.inf, hit_dist),
+                           axis=1)
+    opponent_col = 1 - hitter_col
+
+    # First frame at or after f where each player is inside their recovery
+    # circle (total_frames if never)
+    in_circle = np.sqrt(((player_arr - baseline_arr)**2).sum(
+        axis=2)) <= RECOVERY_RADIUS_PX
+    circle_frame = np.where(in_circle,
+                            np.arange(total_frames)[:, None], total_frames)
+    next_circle_frame = np.minimum.accumulate(circle_frame[::-1],
+                                              axis=0)[::-1]
+
+    recovery_frame = next_circle_frame[shot_start, opponent_col]
+    recovery_time = np.where(recovery_frame < shot_end,
+                             (recovery_frame - shot_start) / fps, -1)
+
+    shot_frames = shot_end - shot_start
+    ball_dist_px = np.sqrt(
+        ((ball_arr[shot_end] - ball_arr[shot_start])**2).sum(axis=1))
+    ball_speeds = ball_dist_px * PX_PER_FRAME_TO_KMH / shot_frames
+
+    opp_dist_px = np.sqrt(((player_arr[shot_end, opponent_col] -
+                            player_arr[shot_start, opponent_col])**2).sum(axis=1))
+    # An opponent missing at either end of the shot counts as not moving
+    opp_speeds = np.nan_to_num(opp_dist_px * PX_PER_FRAME_TO_KMH / shot_frames)
+
+    # One stats row per shot start (plus an all-zero row at frame 0):
+    # counts and totals are running sums, "last" values carry forward from
+    # the player's most recent shot
+    hitter = hitter_col + 1
+    opponent = opponent_col + 1
+    stats = {"frame_num": np.concatenate(([0], shot_start))}
+    for pid in (1, 2):
+        hits = hitter == pid
+        moves = opponent == pid
+        stats[f"player_{pid}_number_of_shots"] = np.concatenate(
+            ([0], np.cumsum(hits)))
+        stats[f"player_{pid}_total_shot_speed"] = np.concatenate(
+            ([0.0], np.cumsum(np.where(hits, ball_speeds, 0.0))))
+        stats[f"player_{pid}_last_shot_speed"] = pd.Series(
+            np.concatenate(([0.0], np.where(hits, ball_speeds,
+                                            np.nan)))).ffill().to_numpy()
+        stats[f"player_{pid}_total_player_speed"] = np.concatenate(
+            ([0.0], np.cumsum(np.where(moves, opp_speeds, 0.0))))
+        stats[f"player_{pid}_last_player_speed"] = pd.Series(
+            np.concatenate(([0.0], np.where(moves, opp_speeds,
+                                            np.nan)))).ffill().to_numpy()
+
+    # Averages are taken per shot row, before the rows are spread over
+    # frames. A player moves while the opponent's shot is in flight, so
+    # movement speed is averaged over the opponent's shot count.
+    for pid, opp in ((1, 2), (2, 1)):
+        stats[f"player_{pid}_average_shot_speed"] = (
+            stats[f"player_{pid}_total_shot_speed"] /
+            np.maximum(stats[f"player_{pid}_number_of_shots"], 1))
+        stats[f"player_{pid}_average_player_speed"] = (
+            stats[f"player_{pid}_total_player_speed"] /
+            np.maximum(stats[f"player_{opp}_number_of_shots"], 1))
+
+    # Spread the per-shot rows over every frame: each frame takes the last
+    # row at or before it. A shot on frame 0 shares its frame with the zero
+    # row, so the later row wins.
+    row_by_frame = np.searchsorted(stats.pop("frame_num"),
+                                   np.arange(total_frames), side="right") - 1
+    df = pd.DataFrame({col: values[row_by_frame]
+                       for col, values in stats.items()})
+
+    # The overlay reads plain arrays per frame; a pandas row lookup costs
+    # far more than the drawing it feeds
+    speed_rows = df[SPEED_COLUMNS].to_numpy().tolist()
+    last_shot_speeds = np.maximum(df["player_1_last_shot_speed"].to_numpy(),
+                                  df["player_2_last_shot_speed"].to_numpy())
 
     # ===============================
     # DISTANCE TRAVELED (FIXED)
     # ===============================
-    distance_traveled = {1: 0.0, 2: 0.0}
-    distance_display = {1: 0.0, 2: 0.0}
-    last_positions = {1: None, 2: None}
-    DIST_UPDATE_FRAMES = int(2 * FPS)
-
-    final_frames = []
-    last_recovery_display = {1: 0, 2: 0}
-
-    for i, frame in enumerate(frames):
+    # Running total per frame, summed over each player's consecutive
+    # detections in one pass instead of inside the draw loop
+    DIST_UPDATE_FRAMES = max(1, int(2 * fps))
+    frame_ids = np.arange(total_frames)
+    distance_by_frame = {}
+    # Bounding boxes of players 1 and 2 per frame, NaN where not detected
+    player_boxes = np.full((total_frames, 2, 4), np.nan)
+    for f, dets in enumerate(player_dets):
+        for pid, box in dets.items():
+            player_boxes[f, player_col[pid]] = box
+    # Whole-pixel box centers, as get_center_of_bbox computes them
+    player_centers = np.trunc((player_boxes[..., :2] + player_boxes[..., 2:]) / 2)
+    for pid in (1, 2):
+        rows = np.flatnonzero(~np.isnan(player_centers[:, pid - 1, 0]))
+        centers = player_centers[rows, pid - 1]
+        steps_px = np.sqrt((np.diff(centers, axis=0)**2).sum(axis=1))
+        cumulative = np.concatenate(([0.0], np.cumsum(steps_px * PX_TO_M)))
+
+        # Each frame shows the total as of the player's latest detection
+        latest = np.searchsorted(rows, frame_ids, side="right") - 1
+        distance_by_frame[pid] = np.where(latest >= 0,
+                                          cumulative[np.maximum(latest, 0)],
+                                          0.0)
+
+    distance_traveled = {
+        pid: float(dist[-1]) if total_frames else 0.0
+        for pid, dist in distance_by_frame.items()
+    }
 
-        cv2.putText(frame, f"Frame: {i}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+    # Bounce status and recovery time shown on each frame, carried forward
+    # from the frames where they change
+    bounce_idx = np.array(bounce_frames, dtype=np.int64)
+    bounce_idx = bounce_idx[ball_visible[bounce_idx]]
+    bounce_status = pd.Series(
+        np.where(mini_court.are_points_inside_court(ball_arr[bounce_idx]),
+                 "IN", "OUT"),
+        index=bounce_idx,
+        dtype=object).reindex(range(total_frames)).ffill().fillna("IN").tolist()
+    ball_in_out_status = bounce_status[-1] if total_frames else "IN"
+
+    # Each player's latest recovery time (as the opponent of a shot), 0
+    # before their first one
+    recovery_display = {}
+    for pid in (1, 2):
+        moves = opponent_col == pid - 1
+        values = np.concatenate(([0.0], recovery_time[moves]))
+        recovery_display[pid] = values[np.searchsorted(
+            shot_start[moves], frame_ids, side="right")].tolist()
+
+    # Composites are drawn into a ring of preallocated buffers, sized so a
+    # buffer is never reused while a worker, the write queue or the encoder
+    # still holds it
+    height, width = first_frame.shape[:2]
+    composites = [
+        np.empty((height, width + 2 * TABLE_WIDTH, 3), dtype=np.uint8)
+        for _ in range(WRITE_PREFETCH + 2 + 2 * ANNOTATE_WORKERS)
+    ]
+
+    # The speed table only changes when a new stats row starts, so the last
+    # rendered one is reused until then. Held as one (row, table) tuple so
+    # worker threads always read a matching pair.
+    speed_table_cache = [(None, None)]
+
+    # Annotation pass: decode and encode run on their own threads and frames
+    # are drawn on ANNOTATE_WORKERS threads. Every per-frame value is
+    # precomputed above, so frames can be drawn in any order.
+    def annotate(i, frame):
+        frame = player_tracker.draw_bboxes([frame], [player_dets[i]])[0]
+        frame = ball_tracker.draw_bboxes([frame], [ball_dets[i]])[0]
+        frame = court_detector.draw_keypoints(frame, court_kps)
+        frame = mini_court.draw_mini_court([frame])[0]
+        mini_court.draw_circle_on_mini_court([frame], baseline_centers,
+                                             int(RECOVERY_RADIUS_PX),
+                                             (255, 0, 0), 2)
+        for point in mc_points[i][mc_visible[i]].tolist():
+            cv2.circle(frame, tuple(point), 5, (0, 255, 0), -1)
+        if ball_visible[i]:
+            cv2.circle(frame, tuple(ball_points[i].tolist()), 5,
+                       (0, 255, 255), -1)
+
+        cv2.putText(frame, f"Frame: {i * frame_stride}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
                     1, (0, 255, 0), 2)
 
-        # inside main loop
-        if player_dets[i]:
-            for pid, (x1, y1, x2, y2) in player_dets[i].items():
-                center = (int((x1 + x2) / 2), int((y1 + y2) / 2))
-
-                if last_positions[pid] is not None:
-                    dist_px = measure_distance(last_positions[pid], center)
-                    dist_m = convert_pixel_distance_to_meters(
-                        dist_px, constants.DOUBLE_LINE_WIDTH,
-                        mini_court.get_width_of_mini_court())
-                    distance_traveled[pid] += dist_m
-
-                last_positions[pid] = center
-
-        if i % DIST_UPDATE_FRAMES == 0:
-            distance_display[1] = distance_traveled[1]
-            distance_display[2] = distance_traveled[2]
-
-        if i in bounce_frames and i in ball_mc:
-            ball_pt = ball_mc[i][1]
-            ball_in_out_status = (
-                "IN" if mini_court.is_point_inside_court(ball_pt) else "OUT")
-
-        if i in player_mc and i in ball_mc:
-            for pid in player_mc[i]:
-                if measure_distance(player_mc[i][pid],
-                                    ball_mc[i][1]) <= BALL_TOUCH_RADIUS_PX:
-                    if player_ball_touch_time[pid] is None:
-                        player_ball_touch_time[pid] = i / FPS
-
-        if i in player_mc:
-            for pid in player_mc[i]:
-                if measure_distance(
-                        player_mc[i][pid], baseline_centers[pid]
-                ) <= RECOVERY_RADIUS_PX + RECOVERY_TOUCH_BUFFER:
-                    if player_circle_touch_time[pid] is None:
-                        player_circle_touch_time[pid] = i / FPS
-
-        if i in recovery_times_by_frame:
-            for pid, val in recovery_times_by_frame[i].items():
-                last_recovery_display[pid] = val
+        # Display refreshes every DIST_UPDATE_FRAMES frames
+        shown = i - i % DIST_UPDATE_FRAMES
+        distance_display = {
+            1: distance_by_frame[1][shown],
+            2: distance_by_frame[2][shown]
+        }
+
+        last_recovery_display = {
+            1: recovery_display[1][i],
+            2: recovery_display[2][i]
+        }
 
         ball_coords = None
         if ball_dets[i]:
@@ -376,24 +510,34 @@ def main(input_video=None, output_video=None):
         player_coords = {}
         if player_dets[i]:
             for pid, (x1, y1, x2, y2) in player_dets[i].items():
-                player_coords[pid] = (int((x1 + x2) / 2), int((y1 + y2) / 2))
-
-        last_ball_speed = max(df.iloc[i]["player_1_last_shot_speed"],
-                              df.iloc[i]["player_2_last_shot_speed"])
-
-        table1 = draw_ball_table(frame.shape[0], ball_coords, player_coords,
-                                 last_ball_speed, last_recovery_display,
-                                 ball_in_out_status, distance_display)
-        table2 = draw_speed_table(frame.shape[0], df.iloc[i])
-
-        final_frames.append(np.hstack((frame, table1, table2)))
-
-    save_video(final_frames, output_video)
+                player_coords[player_col[pid] + 1] = (int((x1 + x2) / 2),
+                                                      int((y1 + y2) / 2))
+
+        last_ball_speed = last_shot_speeds[i]
+
+        composite = composites[i % len(composites)]
+        composite[:, :width] = frame
+        draw_ball_table(height, ball_coords, player_coords, last_ball_speed,
+                        last_recovery_display, bounce_status[i],
+                        distance_display,
+                        out=composite[:, width:width + TABLE_WIDTH])
+        cached_row, speed_table = speed_table_cache[0]
+        if cached_row != row_by_frame[i]:
+            speed_table = draw_speed_table(height, speed_rows[i])
+            speed_table_cache[0] = (row_by_frame[i], speed_table)
+        composite[:, width + TABLE_WIDTH:] = speed_table
+
+        if frame_callback is not None:
+            frame_callback(i, composite)
+        return composite
+
+    process_video_threads(input_video, output_video, annotate, fps=fps,
+                          prefetch=WRITE_PREFETCH, workers=ANNOTATE_WORKERS,
+                          stride=frame_stride)
     print(f"[TennisAnalysis] Annotated video saved to: {output_video}")
 
     # Compile analysis results to return
-    total_frames = len(video_frames)
-    duration_seconds = total_frames / FPS
+    duration_seconds = total_frames / fps
 
     # Get final stats from DataFrame
     final_stats = df.iloc[-1] if len(df) > 0 else {}
@@ -426,7 +570,7 @@ def main(input_video=None, output_video=None):
         "annotated_video_path": output_video,
         "video": {
             "total_frames": total_frames,
-            "fps": FPS,
+            "fps": fps,
             "duration_seconds": duration_seconds
         },
         "players": {
@@ -481,5 +625,17 @@ def main(input_video=None, output_video=None):
     return analysis_results
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tennis match analysis")
+    parser.add_argument("--input_video", type=str, required=True,
+                        help="Path to the input video")
+    parser.add_argument("--output_video", type=str, required=True,
+                        help="Path to save the annotated video")
+    parser.add_argument("--vid_stride", type=int, default=1,
+                        help="Analyze every Nth frame")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(args.input_video, args.output_video, frame_stride=args.vid_stride)
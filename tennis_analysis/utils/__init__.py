@@ -1,4 +1,4 @@
-from .video_utils import read_video, save_video
+from .video_utils import iter_video, read_video, save_video, open_video_capture, open_video_writer, iter_sampled_frames, iter_frame_batches, process_video_threads
 from .bbox_utils import get_center_of_bbox, measure_distance, get_foot_position,get_closest_keypoint_index,get_height_of_bbox,measure_xy_distance,get_center_of_bbox
 from .conversions import convert_pixel_distance_to_meters, convert_meters_to_pixel_distance
 from .player_stats_drawer_utils import draw_player_stats
\ No newline at end of file
@@ -1,19 +1,231 @@
 import cv2
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def open_video_capture(video_path):
+    """
+    Open a VideoCapture on the FFmpeg backend with hardware decode when the
+    OpenCV build supports it, falling back to the default backend.
+    """
+    cap = None
+    if hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+    if cap is None or not cap.isOpened():
+        cap = cv2.VideoCapture(video_path)
+    # Don't let the backend queue decoded frames ahead of us
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+def open_video_writer(video_path, codec, fps, frame_size):
+    """
+    Open a VideoWriter on the FFmpeg backend with hardware encode when the
+    OpenCV build supports it, falling back to the default encoder.
+    """
+    fourcc = cv2.VideoWriter_fourcc(*codec)
+    out = None
+    if hasattr(cv2, 'VIDEOWRITER_PROP_HW_ACCELERATION'):
+        out = cv2.VideoWriter(video_path, cv2.CAP_FFMPEG, fourcc, fps, frame_size, [cv2.VIDEOWRITER_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+    if out is None or not out.isOpened():
+        out = cv2.VideoWriter(video_path, fourcc, fps, frame_size)
+    return out
+
+def iter_video(video_path):
+    """
+    Yield frames one at a time, so callers that only walk the video once
+    never hold more than the current frame.
+    """
+    cap = open_video_capture(video_path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
 
 def read_video(video_path):
-    cap = cv2.VideoCapture(video_path)
-    frames = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    cap.release()
-    return frames
+    return list(iter_video(video_path))
+
+def iter_sampled_frames(video_path, stride=1):
+    """
+    Yield (frame_idx, frame) for every stride-th frame.
+
+    Inter-frame codecs still need every frame decoded, but only the sampled
+    ones are retrieved as BGR arrays, through OpenCV grab()/retrieve() on the
+    same capture as read_video, which also applies rotation metadata.
+    """
+    cap = open_video_capture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {video_path}")
+    try:
+        frame_idx = 0
+        while cap.grab():
+            if frame_idx % stride == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                yield frame_idx, frame
+            frame_idx += 1
+    finally:
+        cap.release()
+
+def iter_frame_batches(video_path, batch_size, prefetch=64, stride=1):
+    """
+    Yield lists of up to batch_size frames, taking every stride-th frame.
+    Frames are decoded by iter_sampled_frames on a background thread into a
+    bounded queue, so decoding overlaps with whatever the caller does with
+    each batch.
+    """
+    frames = iter_sampled_frames(video_path, stride)
+    read_q = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    reader_errors = []
+
+    def reader():
+        try:
+            for _, frame in frames:
+                if stop.is_set():
+                    break
+                read_q.put(frame)
+        except Exception as e:
+            reader_errors.append(e)
+        finally:
+            frames.close()
+            read_q.put(None)
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+
+    try:
+        batch = []
+        while True:
+            frame = read_q.get()
+            if frame is None:
+                break
+            batch.append(frame)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if reader_errors:
+            raise reader_errors[0]
+        if batch:
+            yield batch
+    finally:
+        stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while reader_thread.is_alive():
+            try:
+                read_q.get(timeout=0.1)
+            except queue.Empty:
+                pass
 
 def save_video(output_video_frames, output_video_path):
-    fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-    out = cv2.VideoWriter(output_video_path, fourcc, 24, (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
+    out = open_video_writer(output_video_path, 'MJPG', 24, (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
     for frame in output_video_frames:
         out.write(frame)
-    out.release()
\ No newline at end of file
+    out.release()
+
+def process_video_threads(input_video_path, output_video_path, callback, fps=24, prefetch=32, codec='MJPG', workers=1, stride=1):
+    """
+    Decode -> process -> encode with decode and encode on their own threads.
+
+    callback(frame_idx, frame) returns the frame to write. Frames come from
+    iter_sampled_frames, so only every stride-th input frame is converted and
+    processed; frame_idx counts those processed frames, so it matches the
+    batches from iter_frame_batches with the same stride. With workers=1 it
+    runs on the calling thread; with more, up to 2 * workers frames are
+    processed concurrently on a thread pool (OpenCV drawing releases the GIL)
+    and written back in frame order, so the callback must not depend on the
+    previous frame. The VideoWriter is only touched by the writer thread and is
+    opened on the first frame, so callbacks may change the output size.
+    Returned frames may still be queued or encoding for prefetch + 1 more
+    frames, so a callback that reuses output buffers needs a ring of at least
+    prefetch + 2 + 2 * workers.
+
+    Returns:
+        int: Number of frames written
+    """
+    frames = iter_sampled_frames(input_video_path, stride)
+    read_q = queue.Queue(maxsize=prefetch)
+    write_q = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    reader_errors = []
+    writer_errors = []
+
+    def reader():
+        try:
+            for sample_idx, (_, frame) in enumerate(frames):
+                if stop.is_set():
+                    break
+                read_q.put((sample_idx, frame))
+        except Exception as e:
+            reader_errors.append(e)
+        finally:
+            frames.close()
+            read_q.put(None)
+
+    def writer():
+        out = None
+        try:
+            while True:
+                frame = write_q.get()
+                if frame is None:
+                    break
+                if out is None:
+                    out = open_video_writer(output_video_path, codec, fps, (frame.shape[1], frame.shape[0]))
+                out.write(frame)
+        except Exception as e:
+            writer_errors.append(e)
+            # Keep draining so the producer never blocks on a full queue
+            while write_q.get() is not None:
+                pass
+        finally:
+            if out is not None:
+                out.release()
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    reader_thread.start()
+    writer_thread.start()
+
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = deque()
+    frames_written = 0
+    try:
+        while True:
+            item = read_q.get()
+            if item is None:
+                break
+            frame_idx, frame = item
+            if executor is None:
+                write_q.put(callback(frame_idx, frame))
+                frames_written += 1
+                continue
+            pending.append(executor.submit(callback, frame_idx, frame))
+            if len(pending) >= 2 * workers:
+                write_q.put(pending.popleft().result())
+                frames_written += 1
+        while pending:
+            write_q.put(pending.popleft().result())
+            frames_written += 1
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while reader_thread.is_alive():
+            try:
+                read_q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        write_q.put(None)
+        writer_thread.join()
+
+    if reader_errors:
+        raise reader_errors[0]
+    if writer_errors:
+        raise writer_errors[0]
+    return frames_written